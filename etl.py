@@ -2,6 +2,8 @@ import pandas as pd
 import sqlite3
 import os
 import logging
+from sketches import refresh_trip_sketches, sketch_columns
+from zones import enrich_zones, add_missing_zone_columns, load_zone_lookup, zone_lookup_file
 
 # Set up logging to file and console
 log_file = 'data_processing.log'
@@ -115,22 +117,31 @@ def clean_green_data(green):
 # Function to clean data based on filename pattern
 def clean_data_based_on_filename(file_name, df):
     if 'green' in file_name.lower():
-        return clean_green_data(df)
+        cleaned_df = clean_green_data(df)
     elif 'yellow' in file_name.lower():
-        return clean_yellow_data(df)
+        cleaned_df = clean_yellow_data(df)
     elif 'fhv' in file_name.lower() and 'fhvhv' not in file_name.lower():
-        return clean_fhv_data(df)
+        cleaned_df = clean_fhv_data(df)
     elif 'fhvhv' in file_name.lower():
-        return clean_fhvhv_data(df)
+        cleaned_df = clean_fhvhv_data(df)
     else:
         raise ValueError("Filename does not match any known dataset type.")
 
+    # Add borough/zone/service zone codes for pickup and dropoff locations
+    return enrich_zones(cleaned_df)
+
 
 
 
 
 # Function to load data, clean it, and save the results
-def process_data(base_dir, year=None, start_month=None, end_month=None):
+def process_data(base_dir, year=None, start_month=None, end_month=None, require_zone_lookup=True):
+    # The zone lookup is needed for the zone enrichment, check it before loading any month
+    if load_zone_lookup() is None:
+        if require_zone_lookup:
+            raise FileNotFoundError(f"Zone lookup file not found: {zone_lookup_file} (pass require_zone_lookup=False to load without zones)")
+        logging.error(f"Zone lookup file not found: {zone_lookup_file}, every zone code of this run will be set to -1")
+
     # Handle if only a year is passed, or both year and month range are passed
     if start_month and not end_month:
         end_month = start_month  # Process only the start month if no end month is provided
@@ -183,7 +194,15 @@ def save_cleaned_data(cleaned_data, dataset_name, year, month_name):
     conn = sqlite3.connect('trip_sample_data.db')
     logging.info(f"Inserting {dataset_name.upper()} data into SQLite database")
     
+    # Tables created before the zone enrichment do not have the zone code columns yet
+    add_missing_zone_columns(conn, f'{dataset_name}_tripdata')
     cleaned_data.to_sql(f'{dataset_name}_tripdata', conn, if_exists='append', index=False)
+
+    # Rebuild the quantile and distinct-count sketches of every pickup month this batch touched
+    # (files also hold stray timestamps and next-month rollovers) so reports can merge them later
+    logging.info(f"Updating {dataset_name.upper()} sketches for {month_name} {year}")
+    pickup_months = cleaned_data[sketch_columns[dataset_name]['pickup']].dt.strftime('%Y-%m').dropna().unique()
+    refresh_trip_sketches(conn, dataset_name, pickup_months)
     conn.close()
 
 # Example usage:
@@ -191,4 +210,5 @@ base_dir = 'C:/Users/ASH/Downloads/Data Engineering/Scrapping Work/data' # adjus
 #process_data(base_dir, year=2024, start_month='06')  # Process for a specific year and month
 #process_data(base_dir, year=2024, start_month='01', end_month='04')  # Process for a month range
 #process_data(base_dir, year=2024)  # Process for the whole year
+#process_data(base_dir, require_zone_lookup=False)  # Load without taxi_zone_lookup.csv (zone codes set to -1)
 process_data(base_dir)
\ No newline at end of file
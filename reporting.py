@@ -2,6 +2,8 @@ import sqlite3
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
+from sketches import quantile_report, distinct_zones_report, backfill_trip_sketches, sketch_columns, ALL_HOURS
+from zones import decode_zones, load_zone_lookup
 
 # Connect to the SQLite database
 conn = sqlite3.connect('trip_sample_data.db')
@@ -404,5 +406,133 @@ plt.tight_layout()
 plt.show()
 
 
+
+
+# -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+#                                                                   SKETCH BASED ANALYSIS (P50 / P95 / P99 AND DISTINCT ZONES)
+# -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# The monthly sketches stored by etl.py are merged here, pass start_month/end_month ('YYYY-MM') to restrict the date range
+
+# Pickup months in the tripdata tables without sketches (e.g. loaded before the sketches existed) get them built from the stored rows
+for dataset_name in sketch_columns:
+    backfill_trip_sketches(conn, dataset_name)
+
+# Trip duration percentiles per hour of the day (Yellow Taxi)
+df_yellow_duration_quantiles = quantile_report(conn, 'yellow', 'trip_duration_minutes')
+df_yellow_duration_quantiles = df_yellow_duration_quantiles[df_yellow_duration_quantiles['group_key'] != ALL_HOURS]
+
+# Visualization: Line Plot for Trip Duration Percentiles per Hour
+plt.figure(figsize=(12, 6))
+for percentile in ['p50', 'p95', 'p99']:
+    sns.lineplot(x='group_key', y=percentile, data=df_yellow_duration_quantiles, marker='o', label=percentile)
+plt.title('Yellow: Trip Duration Percentiles per Hour', fontsize=16)
+plt.xlabel('Hour of the Day', fontsize=14)
+plt.ylabel('Trip Duration (minutes)', fontsize=14)
+plt.grid(True)
+plt.tight_layout()
+plt.show()
+
+
+
+# Trip duration and fare percentiles per month (Yellow Taxi)
+df_yellow_monthly_quantiles = quantile_report(conn, 'yellow', 'trip_duration_minutes', by_month=True)
+df_yellow_monthly_quantiles = df_yellow_monthly_quantiles[df_yellow_monthly_quantiles['group_key'] == ALL_HOURS].copy()
+df_yellow_monthly_quantiles['year_month'] = pd.to_datetime(df_yellow_monthly_quantiles['year_month'])
+
+# Visualization: Line Plot for Monthly Trip Duration Percentiles
+fig, ax = plt.subplots(figsize=(14, 8))
+for percentile in ['p50', 'p95', 'p99']:
+    sns.lineplot(x='year_month', y=percentile, data=df_yellow_monthly_quantiles, marker='o', label=percentile, ax=ax)
+plt.title('Yellow: Trip Duration Percentiles Over the Year (Month-wise)', fontsize=18)
+plt.xlabel('Year-Month', fontsize=14)
+plt.ylabel('Trip Duration (minutes)', fontsize=14)
+plt.grid(visible=True, which='both', axis='both', color='gray', linestyle='--', linewidth=0.5)
+plt.xticks(rotation=45, ha='right')
+plt.tight_layout()
+plt.show()
+
+df_yellow_monthly_fare_quantiles = quantile_report(conn, 'yellow', 'total_amount', by_month=True)
+df_yellow_monthly_fare_quantiles = df_yellow_monthly_fare_quantiles[df_yellow_monthly_fare_quantiles['group_key'] == ALL_HOURS].copy()
+df_yellow_monthly_fare_quantiles['year_month'] = pd.to_datetime(df_yellow_monthly_fare_quantiles['year_month'])
+
+# Visualization: Line Plot for Monthly Fare Percentiles
+fig, ax = plt.subplots(figsize=(14, 8))
+for percentile in ['p50', 'p95', 'p99']:
+    sns.lineplot(x='year_month', y=percentile, data=df_yellow_monthly_fare_quantiles, marker='o', label=percentile, ax=ax)
+plt.title('Yellow: Total Fare Percentiles Over the Year (Month-wise)', fontsize=18)
+plt.xlabel('Year-Month', fontsize=14)
+plt.ylabel('Total Fare ($)', fontsize=14)
+plt.grid(visible=True, which='both', axis='both', color='gray', linestyle='--', linewidth=0.5)
+plt.xticks(rotation=45, ha='right')
+plt.tight_layout()
+plt.show()
+
+
+
+# Speed and fare percentiles over the whole range for each dataset
+for dataset_name, metric in [('yellow', 'average_speed_mph'), ('yellow', 'total_amount'),
+                             ('green', 'average_speed_mph'), ('green', 'total_amount'),
+                             ('fhvhv', 'average_speed_mph'), ('fhvhv', 'base_passenger_fare')]:
+    df_quantiles = quantile_report(conn, dataset_name, metric)
+    print(f"{dataset_name.upper()} {metric} percentiles:")
+    print(df_quantiles[df_quantiles['group_key'] == ALL_HOURS].to_string(index=False))
+
+
+
+# Distinct pickup zones per base (FHVHV)
+df_fhvhv_zones_per_base = distinct_zones_report(conn, 'fhvhv').sort_values('distinct_pickup_zones', ascending=False)
+
+# Visualization: Bar Plot for Distinct Pickup Zones per Base
+plt.figure(figsize=(10, 6))
+sns.barplot(x='base', y='distinct_pickup_zones', data=df_fhvhv_zones_per_base, palette='viridis')
+plt.title('FHVHV: Distinct Pickup Zones per Base', fontsize=16)
+plt.xlabel('Dispatching Base', fontsize=14)
+plt.ylabel('Distinct Pickup Zones (approx.)', fontsize=14)
+plt.xticks(rotation=45)
+plt.tight_layout()
+plt.show()
+
+
+
+
+# -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+#                                                                   ZONE ANALYSIS
+# -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# The borough codes are added during cleaning (see zones.py), so no join with the zone lookup is needed
+# The section is skipped when the lookup file is missing or the table was loaded before the enrichment (no pu_borough column)
+yellow_columns = [row[1] for row in conn.execute("PRAGMA table_info(yellow_tripdata)")]
+
+if load_zone_lookup() is None or 'pu_borough' not in yellow_columns:
+    print("Skipping zone analysis: zone lookup file missing or yellow_tripdata has no zone columns")
+else:
+    # SQL Query: Trips and Average Fare per Pickup Borough (Yellow Taxi)
+    query_yellow_trips_per_borough = """
+    SELECT
+        pu_borough,
+        COUNT(*) AS trip_count,
+        AVG(total_amount) AS avg_fare
+    FROM
+        yellow_tripdata
+    GROUP BY
+        pu_borough
+    ORDER BY
+        trip_count DESC;
+    """
+    df_yellow_trips_per_borough = pd.read_sql_query(query_yellow_trips_per_borough, conn)
+    df_yellow_trips_per_borough['pu_borough'] = decode_zones(df_yellow_trips_per_borough['pu_borough'], 'borough')
+
+    # Visualization: Bar Plot for Trips per Pickup Borough
+    plt.figure(figsize=(10, 6))
+    sns.barplot(x='pu_borough', y='trip_count', data=df_yellow_trips_per_borough, palette='Set2')
+    plt.title('Yellow: Trips per Pickup Borough', fontsize=16)
+    plt.xlabel('Pickup Borough', fontsize=14)
+    plt.ylabel('Number of Trips', fontsize=14)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    plt.show()
+
+
 # Close the connection to the database
 conn.close()
@@ -0,0 +1,338 @@
+import numpy as np
+import pandas as pd
+import logging
+
+# Columns used to build sketches for each dataset.
+# 'pickup' is the pickup timestamp used to bucket trips per hour,
+# 'quantiles' are the numeric columns summarised with a KLL sketch and
+# 'base' is the column whose distinct pickup zones are counted with HyperLogLog.
+sketch_columns = {
+    'fhv': {
+        'pickup': 'pickup_datetime',
+        'quantiles': ['trip_duration_minutes'],
+        'base': 'dispatching_base_num'
+    },
+    'fhvhv': {
+        'pickup': 'pickup_datetime',
+        'quantiles': ['trip_duration_minutes', 'average_speed_mph', 'base_passenger_fare'],
+        'base': 'dispatching_base_num'
+    },
+    'yellow': {
+        'pickup': 'tpep_pickup_datetime',
+        'quantiles': ['trip_duration_minutes', 'average_speed_mph', 'total_amount'],
+        'base': None
+    },
+    'green': {
+        'pickup': 'lpep_pickup_datetime',
+        'quantiles': ['trip_duration_minutes', 'average_speed_mph', 'total_amount'],
+        'base': None
+    }
+}
+
+# Group key used for the sketch covering the whole month
+ALL_HOURS = 'all'
+
+
+class KLLSketch:
+    """
+    Mergeable approximate quantile sketch (KLL).
+    Keeps a stack of compactors where an item at level h stands for 2**h original values,
+    so the memory stays around a few times k whatever the number of trips.
+    """
+
+    kind = 'kll'
+
+    def __init__(self, k=200, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        # Unseeded by default so every sketch uses its own compaction offsets and the errors of merged sketches stay independent
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level):
+        # Lower levels get smaller buffers, the top level holds k items
+        depth = len(self.compactors) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            if len(self.compactors[level]) > self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(self.compactors[level])
+                # Keep the odd item out at this level so the weights stay exact
+                keep = items[len(items) - len(items) % 2:]
+                items = items[:len(items) - len(items) % 2]
+                offset = self._rng.integers(2)
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], items[offset::2]])
+            level += 1
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return self
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self.n += len(values)
+        self._compress()
+        return self
+
+    def merge(self, other):
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.empty(0))
+        for level, items in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs):
+        qs = np.atleast_1d(np.asarray(qs, dtype=float))
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2.0 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='mergesort')
+        items = items[order]
+        cumulative = np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        return items[np.minimum(positions, len(items) - 1)]
+
+    def to_bytes(self):
+        header = np.array([self.k, self.n, len(self.compactors)] + [len(c) for c in self.compactors], dtype=np.int64)
+        return header.tobytes() + np.concatenate(self.compactors).astype(np.float64).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        k, n, levels = np.frombuffer(data, dtype=np.int64, count=3)
+        sizes = np.frombuffer(data, dtype=np.int64, count=levels, offset=3 * 8)
+        items = np.frombuffer(data, dtype=np.float64, offset=(3 + levels) * 8)
+        sketch = cls(k=int(k))
+        sketch.n = int(n)
+        sketch.compactors = [c.copy() for c in np.split(items, np.cumsum(sizes)[:-1])]
+        return sketch
+
+
+class HyperLogLog:
+    """
+    Mergeable approximate distinct counter.
+    Uses 2**p one-byte registers (4 KB for the default p=12, about 1.6% standard error).
+    """
+
+    kind = 'hll'
+
+    def __init__(self, p=12):
+        self.p = p
+        self.registers = np.zeros(2 ** p, dtype=np.uint8)
+
+    def update(self, values):
+        values = pd.Series(values).dropna()
+        if len(values) == 0:
+            return self
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        width = 64 - self.p
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        remainder = hashes & np.uint64((1 << width) - 1)
+
+        # Exact bit length of the remaining bits, found with a vectorised binary search
+        bit_length = np.zeros(len(remainder), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            mask = remainder >= np.uint64(1 << shift)
+            bit_length[mask] += shift
+            remainder[mask] >>= np.uint64(shift)
+        bit_length += (remainder > 0)
+
+        rank = (width - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(float))
+        empty = np.count_nonzero(self.registers == 0)
+        # Small range correction (linear counting)
+        if estimate <= 2.5 * m and empty > 0:
+            estimate = m * np.log(m / empty)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        return bytes([self.p]) + self.registers.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        sketch = cls(p=data[0])
+        sketch.registers = np.frombuffer(data, dtype=np.uint8, offset=1).copy()
+        return sketch
+
+
+sketch_types = {KLLSketch.kind: KLLSketch, HyperLogLog.kind: HyperLogLog}
+
+
+def build_trip_sketches(df, dataset_name):
+    """
+    Builds the sketches for the trips of one pickup month.
+    Returns a list of (metric, group_key, sketch) where group_key is the pickup hour ('00'-'23'),
+    'all' for the whole month or the base number for distinct pickup zones.
+    """
+    columns = sketch_columns[dataset_name]
+    sketches = []
+
+    hours = df[columns['pickup']].dt.strftime('%H')
+    for metric in columns['quantiles']:
+        if metric not in df.columns:
+            logging.warning(f"Column {metric} missing from {dataset_name.upper()} data, skipping its sketch")
+            continue
+        sketches.append((metric, ALL_HOURS, KLLSketch().update(df[metric])))
+        for hour, values in df[metric].groupby(hours):
+            sketches.append((metric, hour, KLLSketch().update(values)))
+
+    if columns['base'] and columns['base'] in df.columns and 'pulocationid' in df.columns:
+        # Location ID 0 is the filler used for missing zones during cleaning
+        zones = df[df['pulocationid'] > 0]
+        zone_ids = zones['pulocationid'].astype('int64')
+        for base, values in zone_ids.groupby(zones[columns['base']]):
+            sketches.append(('pickup_zones', base, HyperLogLog().update(values)))
+
+    return sketches
+
+
+def create_sketch_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS trip_sketches (
+            dataset TEXT,
+            year_month TEXT,
+            metric TEXT,
+            group_key TEXT,
+            kind TEXT,
+            sketch BLOB
+        )
+    """)
+
+
+def save_trip_sketches(conn, sketches, dataset_name, year_month):
+    """
+    Stores the sketches of one (dataset, month) batch, replacing any previous run for the same month.
+    """
+    create_sketch_table(conn)
+    conn.execute("DELETE FROM trip_sketches WHERE dataset = ? AND year_month = ?", (dataset_name, year_month))
+    conn.executemany(
+        "INSERT INTO trip_sketches VALUES (?, ?, ?, ?, ?, ?)",
+        [(dataset_name, year_month, metric, str(group_key), sketch.kind, sketch.to_bytes())
+         for metric, group_key, sketch in sketches]
+    )
+    conn.commit()
+
+
+def refresh_trip_sketches(conn, dataset_name, months):
+    """
+    Rebuilds the sketches of the given 'YYYY-MM' pickup months from the rows stored in the dataset's tripdata table.
+    Both etl.py and the backfill go through here, so a month's sketches always summarise exactly the trips
+    the SQL reports see for that pickup month, whichever file the trips were loaded from.
+    """
+    columns = sketch_columns[dataset_name]
+    pickup = columns['pickup']
+    table = f'{dataset_name}_tripdata'
+    table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if not table_columns:
+        logging.warning(f"Table {table} not found, no sketches to build")
+        return
+
+    wanted = [pickup, 'pulocationid', columns['base']] + columns['quantiles']
+    selected = [column for column in wanted if column and column in table_columns]
+
+    for year_month in sorted(months):
+        logging.info(f"Building {dataset_name.upper()} sketches for {year_month}")
+        # Range filter on the stored 'YYYY-MM-DD HH:MM:SS' text instead of strftime so SQLite does not parse every row
+        next_month = str(pd.Period(year_month, freq='M') + 1)
+        df = pd.read_sql_query(
+            f"SELECT {', '.join(selected)} FROM {table} WHERE {pickup} >= ? AND {pickup} < ?",
+            conn, params=(f'{year_month}-01', f'{next_month}-01'), parse_dates=[pickup]
+        )
+        save_trip_sketches(conn, build_trip_sketches(df, dataset_name), dataset_name, year_month)
+
+
+def backfill_trip_sketches(conn, dataset_name):
+    """
+    Builds the sketches of every pickup month present in the dataset's tripdata table but not in trip_sketches,
+    e.g. for months loaded before the sketches existed. Months that already have sketches are left as they are.
+    """
+    table = f'{dataset_name}_tripdata'
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is None:
+        return
+
+    create_sketch_table(conn)
+    pickup = sketch_columns[dataset_name]['pickup']
+    table_months = {row[0] for row in conn.execute(
+        f"SELECT DISTINCT strftime('%Y-%m', {pickup}) FROM {table} WHERE {pickup} IS NOT NULL"
+    )} - {None}
+    sketch_months = {row[0] for row in conn.execute(
+        "SELECT DISTINCT year_month FROM trip_sketches WHERE dataset = ?", (dataset_name,)
+    )}
+
+    missing_months = table_months - sketch_months
+    if missing_months:
+        logging.info(f"Backfilling {dataset_name.upper()} sketches for {len(missing_months)} month(s)")
+        refresh_trip_sketches(conn, dataset_name, missing_months)
+
+
+def load_merged_sketches(conn, dataset_name, metric, start_month=None, end_month=None, by_month=False):
+    """
+    Merges the stored monthly sketches of a metric over a 'YYYY-MM' range (inclusive).
+    Sketches are keyed by the trips' pickup month (not the month of the file they were loaded from),
+    the same rule as the strftime('%Y-%m', pickup) grouping of the SQL reports.
+    Returns a dictionary of group_key -> merged sketch, or (year_month, group_key) -> sketch when by_month is set.
+    """
+    create_sketch_table(conn)
+    query = "SELECT year_month, group_key, kind, sketch FROM trip_sketches WHERE dataset = ? AND metric = ?"
+    params = [dataset_name, metric]
+    if start_month:
+        query += " AND year_month >= ?"
+        params.append(start_month)
+    if end_month:
+        query += " AND year_month <= ?"
+        params.append(end_month)
+
+    merged = {}
+    for year_month, group_key, kind, data in conn.execute(query, params):
+        key = (year_month, group_key) if by_month else group_key
+        sketch = sketch_types[kind].from_bytes(data)
+        if key in merged:
+            merged[key].merge(sketch)
+        else:
+            merged[key] = sketch
+    return merged
+
+
+def quantile_report(conn, dataset_name, metric, quantiles=(0.5, 0.95, 0.99), start_month=None, end_month=None, by_month=False):
+    """
+    Returns a DataFrame with one row per group_key (and per year_month when by_month is set)
+    and one column per quantile (p50, p95, ...).
+    """
+    merged = load_merged_sketches(conn, dataset_name, metric, start_month, end_month, by_month)
+    rows = []
+    for key, sketch in sorted(merged.items()):
+        row = {'year_month': key[0], 'group_key': key[1]} if by_month else {'group_key': key}
+        row['trip_count'] = sketch.n
+        for q, value in zip(quantiles, sketch.quantiles(quantiles)):
+            row[f'p{int(round(q * 100))}'] = value
+        rows.append(row)
+    columns = (['year_month'] if by_month else []) + ['group_key', 'trip_count'] + [f'p{int(round(q * 100))}' for q in quantiles]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def distinct_zones_report(conn, dataset_name, start_month=None, end_month=None):
+    """
+    Returns a DataFrame with the approximate number of distinct pickup zones per base.
+    """
+    merged = load_merged_sketches(conn, dataset_name, 'pickup_zones', start_month, end_month)
+    rows = [{'base': base, 'distinct_pickup_zones': sketch.count()} for base, sketch in merged.items()]
+    return pd.DataFrame(rows, columns=['base', 'distinct_pickup_zones'])
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import logging
+from functools import lru_cache
+
+# TLC taxi zone lookup (LocationID, Borough, Zone, service_zone), download it from the TLC trip record data page
+zone_lookup_file = 'taxi_zone_lookup.csv'
+
+# Attributes taken from the lookup file and the column prefix used for pickup and dropoff locations
+zone_attributes = ['borough', 'zone', 'service_zone']
+location_columns = {'pulocationid': 'pu', 'dolocationid': 'do'}
+
+# Code columns added to the tripdata tables (pu_borough, pu_zone, ..., do_service_zone)
+zone_columns = [f'{prefix}_{attribute}' for prefix in location_columns.values() for attribute in zone_attributes]
+
+# Code used for location IDs that are missing or not in the lookup file (same convention as pandas categoricals)
+UNKNOWN_CODE = -1
+
+
+@lru_cache(maxsize=None)
+def load_zone_lookup(path=zone_lookup_file):
+    """
+    Loads the zone lookup file once into a dense array indexed by location ID.
+    Returns (codes, categories) where codes[location_id] holds the borough, zone and service zone codes
+    and categories maps each attribute to the labels its codes refer to, or None if the file is missing.
+    """
+    try:
+        lookup = pd.read_csv(path)
+    except FileNotFoundError:
+        # Cached like a successful load, so the file is only checked once, callers decide how to report it
+        return None
+    lookup.columns = lookup.columns.str.lower()
+    lookup = lookup.dropna(subset=['locationid'])
+    location_ids = lookup['locationid'].astype('int64').to_numpy()
+
+    codes = np.full((location_ids.max() + 1, len(zone_attributes)), UNKNOWN_CODE, dtype=np.int16)
+    categories = {}
+    for i, attribute in enumerate(zone_attributes):
+        categorical = pd.Categorical(lookup[attribute])
+        codes[location_ids, i] = categorical.codes
+        categories[attribute] = categorical.categories
+
+    logging.info(f"Loaded {len(location_ids)} taxi zones from {path}")
+    return codes, categories
+
+
+def enrich_zones(df, path=zone_lookup_file):
+    """
+    Adds pu_/do_ borough, zone and service_zone code columns for the pickup and dropoff location IDs.
+    The codes are looked up with one array indexing operation per location column.
+    The columns are always added (set to UNKNOWN_CODE without a lookup file) so the table schema stays the same.
+    """
+    lookup = load_zone_lookup(path)
+    # A single unknown row stands in for the lookup when the file is missing
+    codes = lookup[0] if lookup else np.full((1, len(zone_attributes)), UNKNOWN_CODE, dtype=np.int16)
+
+    for column, prefix in location_columns.items():
+        if column not in df.columns:
+            continue
+        location_ids = np.nan_to_num(df[column].to_numpy(dtype=float), nan=0).astype(np.int64)
+        # Map IDs outside the lookup range to 0, which is never a real location
+        location_ids[(location_ids < 0) | (location_ids >= len(codes))] = 0
+        zone_codes = codes[location_ids]
+        for i, attribute in enumerate(zone_attributes):
+            df[f'{prefix}_{attribute}'] = zone_codes[:, i]
+
+    return df
+
+
+def decode_zones(codes, attribute, path=zone_lookup_file):
+    """
+    Converts stored borough, zone or service_zone codes back to their labels.
+    Missing codes (rows loaded before the enrichment) and UNKNOWN_CODE are labelled 'Unmatched',
+    which keeps them apart from the lookup's own 'Unknown' zone.
+    """
+    lookup = load_zone_lookup(path)
+    if lookup is None:
+        raise FileNotFoundError(f"Zone lookup file not found: {path}")
+    _, categories = lookup
+    index = getattr(codes, 'index', None)
+    codes = pd.Series(codes).fillna(UNKNOWN_CODE).to_numpy(dtype=np.int64)
+    labels = pd.Categorical.from_codes(codes, categories=categories[attribute])
+    # Keep the caller's index so the labels can be assigned back to a filtered frame
+    return pd.Series(labels, index=index).astype(object).fillna('Unmatched')
+
+
+def add_missing_zone_columns(conn, table):
+    """
+    Adds the zone code columns to a tripdata table created before the zone enrichment existed.
+    Rows already in the table keep NULL codes, which decode_zones labels 'Unmatched'.
+    """
+    table_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if not table_columns:
+        return
+    for column in zone_columns:
+        if column not in table_columns:
+            logging.info(f"Adding column {column} to {table}")
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+    conn.commit()